@@ -1,13 +1,23 @@
 # -*- coding: utf-8 -*-
 
+from bisect import bisect_left
 import csv
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
 from collections import defaultdict, namedtuple
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 import pkg_resources
 import re
+import stat
 from zipfile import ZipFile
 from enum import Enum, unique
-from io import TextIOWrapper
+from io import BytesIO, TextIOWrapper
+from operator import attrgetter
+
+from .__version__ import __version__
 
 Train = namedtuple("Train", ["name", "kind", "direction", "stops", "service_windows"])
 Station = namedtuple("Station", ["name", "zone"])
@@ -18,7 +28,11 @@ ServiceWindow = namedtuple(
     "ServiceWindow", ["id", "name", "start", "end", "days", "removed"]
 )
 
-_BASE_DATE = datetime(1970, 1, 1, 0, 0, 0, 0)
+_DAY_TRIPS_CACHE_SIZE = 1024
+
+_NO_TRAINS = ((),) * 7
+
+_NO_CACHE_ENV = "CALTRAIN_NO_CACHE"
 
 
 class Trip(namedtuple("Trip", ["departure", "arrival", "duration", "train"])):
@@ -46,19 +60,34 @@ class Trip(namedtuple("Trip", ["departure", "arrival", "duration", "train"])):
         )
 
 
+class _SanitizeTable(dict):
+    """
+    str.translate table that lowercases ASCII letters, keeps ASCII digits
+    and drops every other character.
+    """
+
+    def __missing__(self, key):
+        return None
+
+
+_SANITIZE_TABLE = _SanitizeTable((c, c) for c in range(ord("0"), ord("9") + 1))
+_SANITIZE_TABLE.update((c, c) for c in range(ord("a"), ord("z") + 1))
+_SANITIZE_TABLE.update((c, c + 32) for c in range(ord("A"), ord("Z") + 1))
+
+
+@functools.lru_cache(maxsize=1024)
 def _sanitize_name(name):
     """
     Pre-sanitization to increase the likelihood of finding
-    a matching station.
+    a matching station. Results are cached since the same
+    names tend to be looked up repeatedly.
 
     :param name: the station name
     :type name: str or unicode
 
     :returns: sanitized station name
     """
-    return (
-        "".join(re.split("[^A-Za-z0-9]", name)).lower().replace("station", "").strip()
-    )
+    return name.translate(_SANITIZE_TABLE).replace("station", "")
 
 
 def _resolve_time(t):
@@ -75,10 +104,33 @@ def _resolve_time(t):
 
     :returns: tuple of days and datetime.time
     """
-    hour, minute, second = [int(x) for x in t.split(":")]
-    day, hour = divmod(hour, 24)
-    r = _BASE_DATE + timedelta(hours=hour, minutes=minute, seconds=second)
-    return day, r.time()
+    hour, minute, second = t.split(":")
+    day, hour = divmod(int(hour), 24)
+    return day, time(hour, int(minute), int(second))
+
+
+def _resolve_date(d):
+    """
+    Resolves a GTFS date string (YYYYMMDD) into datetime.date.
+
+    :param d: the date to resolve
+    :type d: str or unicode
+
+    :returns: datetime.date
+    """
+    return date(int(d[0:4]), int(d[4:6]), int(d[6:8]))
+
+
+def _seconds(t):
+    """
+    Returns the number of whole seconds since midnight of a time.
+
+    :param t: the time to convert
+    :type t: datetime.time or datetime
+
+    :returns: int seconds since midnight
+    """
+    return t.hour * 3600 + t.minute * 60 + t.second
 
 
 def _resolve_duration(start, end):
@@ -87,29 +139,111 @@ def _resolve_duration(start, end):
     times that exceed 24 hours or cross a day boundary are correctly
     resolved.
 
-    :param start: the time to resolve
+    :param start: the stop departed from
     :type start: Stop
-    :param end: the time to resolve
+    :param end: the stop arrived at
     :type end: Stop
 
-    :returns: tuple of days and datetime.time
+    :returns: datetime.timedelta
     """
-    start_time = _BASE_DATE + timedelta(
-        hours=start.departure.hour,
-        minutes=start.departure.minute,
-        seconds=start.departure.second,
-        days=start.departure_day,
-    )
-    end_time = _BASE_DATE + timedelta(
-        hours=end.arrival.hour,
-        minutes=end.arrival.minute,
-        seconds=end.arrival.second,
-        days=end.departure_day,
+    start_time = start.departure_day * 86400 + _seconds(start.departure)
+    end_time = end.arrival_day * 86400 + _seconds(end.arrival)
+    return timedelta(seconds=end_time - start_time)
+
+
+def _cache_entry(gtfs_path):
+    """
+    Resolves where the parsed form of a GTFS zip file is cached, and
+    the stamp the cached copy must carry to be used. Each zip file path
+    has a single cache file. The stamp covers the library version and
+    the zip file and this module, so editing either one invalidates the
+    cached copy. Caching is skipped if the CALTRAIN_NO_CACHE environment
+    variable is set or either file cannot be found on disk.
+
+    :param gtfs_path: the path of the GTFS zip file
+    :type gtfs_path: str or unicode
+
+    :returns: tuple of the cache file path and stamp, or None if not
+              caching
+    """
+    if os.environ.get(_NO_CACHE_ENV):
+        return None
+    stamp = [__version__]
+    for path in (gtfs_path, __file__):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp.append((os.path.abspath(path), st.st_mtime_ns, st.st_size))
+    key = hashlib.sha1(os.path.abspath(gtfs_path).encode("utf-8")).hexdigest()
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
     )
-    return end_time - start_time
+    return os.path.join(cache_home, "python-caltrain", key + ".pkl"), tuple(stamp)
+
+
+def _is_private(path):
+    """
+    Checks that a cache file or directory belongs to the current user
+    and cannot be written by anyone else, so it is safe to unpickle
+    from.
+
+    :param path: the path to check
+    :type path: str or unicode
+
+    :returns: whether the path is private to the current user
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        return False
+    return not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
 
+def _csv_reader(data):
+    """
+    Creates a CSV reader over the contents of a file from the GTFS zip
+    file. Files are decompressed in full up front, so rows are decoded
+    from an in-memory buffer rather than small reads against the
+    decompressor.
 
-_STATIONS_RE = re.compile(r"^(.+) Caltrain( Station)?$")
+    :param data: the raw contents of the file
+    :type data: bytes
+
+    :returns: csv.reader over the decoded contents
+    """
+    # GTFS exports often start with a UTF-8 byte order mark, which would
+    # otherwise end up in the first column name.
+    return csv.reader(TextIOWrapper(BytesIO(data), encoding="utf-8-sig", newline=""))
+
+
+def _column_indices(reader, *names):
+    """
+    Reads the header row of a GTFS CSV file and resolves the position
+    of each of the requested columns within a row. An
+    UnexpectedGTFSLayoutError is thrown if a column is missing.
+
+    :param reader: the CSV reader, positioned at the header row
+    :type reader: csv.reader
+    :param names: the names of the columns to resolve
+    :type names: str or unicode
+
+    :returns: tuple of column indices in the order requested
+    """
+    header = next(reader)
+    indices = []
+    for name in names:
+        if name not in header:
+            raise UnexpectedGTFSLayoutError("missing column: {}".format(name))
+        indices.append(header.index(name))
+    return tuple(indices)
+
+
+_NON_ALNUM_RE = re.compile("[^A-Za-z0-9]")
+
+_STATION_SUFFIXES = (" Caltrain Station", " Caltrain")
 
 _RENAME_MAP = {
     "SO. SAN FRANCISCO": "SOUTH SAN FRANCISCO",
@@ -117,6 +251,28 @@ _RENAME_MAP = {
     "CALIFORNIA AVE": "CALIFORNIA AVENUE",
 }
 
+
+@functools.lru_cache(maxsize=None)
+def _display_name(stop_name):
+    """
+    Resolves a stop name from the GTFS file (e.g. "Mt View Caltrain
+    Station") into the name the station is displayed under, applying
+    any renames. Results are cached since only a few dozen distinct
+    stop names exist.
+
+    :param stop_name: the stop name from the GTFS file
+    :type stop_name: str or unicode
+
+    :returns: the display name of the station
+    """
+    for suffix in _STATION_SUFFIXES:
+        if stop_name.endswith(suffix):
+            stop_name = stop_name[: -len(suffix)]
+            break
+    name = stop_name.strip().upper()
+    return _RENAME_MAP.get(name, name).title()
+
+
 _DEFAULT_GTFS_FILE = "data/GTFSTransitData_ct.zip"
 _ALIAS_MAP_RAW = {
     "SAN FRANCISCO": ("SF", "SAN FRAN"),
@@ -157,13 +313,23 @@ _ALIAS_MAP_RAW = {
     "MENLO PARK": "MENLO",
 }
 
-_ALIAS_MAP = {}
 
-for k, v in _ALIAS_MAP_RAW.items():
-    if not isinstance(v, list) and not isinstance(v, tuple):
-        v = (v,)
-    for x in v:
-        _ALIAS_MAP[_sanitize_name(x)] = _sanitize_name(k)
+@functools.lru_cache(maxsize=1)
+def _alias_map():
+    """
+    Builds the map of sanitized station aliases to the sanitized name
+    of the station they refer to. This is only needed when parsing a
+    GTFS file, so it is built on first use rather than at import.
+
+    :returns: dict of sanitized alias to sanitized station name
+    """
+    alias_map = {}
+    for k, v in _ALIAS_MAP_RAW.items():
+        if not isinstance(v, list) and not isinstance(v, tuple):
+            v = (v,)
+        for x in v:
+            alias_map[_sanitize_name(x)] = _sanitize_name(k)
+    return alias_map
 
 
 @unique
@@ -215,8 +381,11 @@ class Caltrain(object):
         self.trains = {}
         self.stations = {}
         self._unambiguous_stations = {}
+        self._sorted_station_names = []
         self._service_windows = {}
         self._fares = {}
+        self._trains_by_pair_day = {}
+        self._day_trips_cache = {}
 
         self.load_from_gtfs(gtfs_path)
 
@@ -231,18 +400,117 @@ class Caltrain(object):
         """
         # Use the default path if not specified.
         if gtfs_path is None:
-            gtfs_handle = pkg_resources.resource_stream(__name__, _DEFAULT_GTFS_FILE)
+            cache_entry = _cache_entry(
+                os.path.join(os.path.dirname(__file__), _DEFAULT_GTFS_FILE)
+            )
         else:
-            gtfs_handle = open(gtfs_path, "rb")
+            cache_entry = _cache_entry(gtfs_path)
+
+        if cache_entry is None or not self._load_from_cache(*cache_entry):
+            if gtfs_path is None:
+                gtfs_handle = pkg_resources.resource_stream(
+                    __name__, _DEFAULT_GTFS_FILE
+                )
+            else:
+                gtfs_handle = open(gtfs_path, "rb")
 
-        with gtfs_handle as f:
-            self._load_from_gtfs(f)
+            with gtfs_handle as f:
+                self._load_from_gtfs(f)
+
+            if cache_entry is not None:
+                self._save_to_cache(*cache_entry)
+
+    def _load_from_cache(self, cache_path, stamp):
+        """
+        Restores the data model from a previously cached GTFS parse.
+        The cache is ignored unless it is private to the current user
+        and carries the expected stamp.
+
+        :param cache_path: the path of the cache file
+        :type cache_path: str or unicode
+        :param stamp: the stamp the cache file must carry
+        :type stamp: tuple
+
+        :returns: whether the data model was restored
+        """
+        if not _is_private(os.path.dirname(cache_path)) or not _is_private(cache_path):
+            return False
+        try:
+            with open(cache_path, "rb") as f:
+                if pickle.load(f) != stamp:
+                    return False
+                state = pickle.load(f)
+        except Exception:
+            return False
+
+        self._day_trips_cache = {}
+        (
+            self.version,
+            self.trains,
+            self.stations,
+            self._unambiguous_stations,
+            self._sorted_station_names,
+            self._service_windows,
+            self._fares,
+            self._trains_by_pair_day,
+        ) = state
+        return True
+
+    def _save_to_cache(self, cache_path, stamp):
+        """
+        Caches the data model so later loads of the same GTFS zip file
+        can skip parsing it. Any previous cache for the file is replaced.
+        Failure to write the cache is ignored.
+
+        :param cache_path: the path of the cache file
+        :type cache_path: str or unicode
+        :param stamp: the stamp to identify the cached data model by
+        :type stamp: tuple
+        """
+        state = (
+            self.version,
+            self.trains,
+            self.stations,
+            self._unambiguous_stations,
+            self._sorted_station_names,
+            self._service_windows,
+            self._fares,
+            self._trains_by_pair_day,
+        )
+        cache_dir = os.path.dirname(cache_path)
+        try:
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        except OSError:
+            return
+        if not _is_private(cache_dir):
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(stamp, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
 
     def _load_from_gtfs(self, handle):
         z = ZipFile(handle)
 
-        self.trains, self.stations = {}, {}
-        self._service_windows, self._fares = defaultdict(list), {}
+        # Trips for a station pair and date only change when new data is
+        # loaded, so cached results are dropped before anything else.
+        self._day_trips_cache = {}
+
+        # Everything is built in locals and only assigned once the whole
+        # file has been read, so a failed load leaves the previous data
+        # model intact.
+        trains, service_windows, fares = {}, defaultdict(list), {}
+        trains_by_pair_day = {}
 
         # -------------------
         # 1. Record fare data
@@ -251,129 +519,202 @@ class Caltrain(object):
         fare_lookup = {}
 
         # Create a map if (start, dest) -> price
-        with z.open("fare_attributes.txt", "r") as csvfile:
-            fare_reader = csv.DictReader(TextIOWrapper(csvfile))
-            for r in fare_reader:
-                fare_lookup[r["fare_id"]] = tuple(int(x) for x in r["price"].split("."))
+        fare_reader = _csv_reader(z.read("fare_attributes.txt"))
+        fare_id, price = _column_indices(fare_reader, "fare_id", "price")
+        for r in fare_reader:
+            dollars, _, cents = r[price].partition(".")
+            fare_lookup[r[fare_id]] = (int(dollars), int(cents) if cents else 0)
 
         # Read in the fare IDs from station X to station Y.
-        with z.open("fare_rules.txt", "r") as csvfile:
-            fare_reader = csv.DictReader(TextIOWrapper(csvfile))
-            for r in fare_reader:
-                if r["origin_id"] == "" or r["destination_id"] == "":
-                    continue
-                k = (int(r["origin_id"]), int(r["destination_id"]))
-                self._fares[k] = fare_lookup[r["fare_id"]]
+        fare_reader = _csv_reader(z.read("fare_rules.txt"))
+        fare_id, origin_id, destination_id = _column_indices(
+            fare_reader, "fare_id", "origin_id", "destination_id"
+        )
+        for r in fare_reader:
+            if r[origin_id] == "" or r[destination_id] == "":
+                continue
+            k = (int(r[origin_id]), int(r[destination_id]))
+            fares[k] = fare_lookup[r[fare_id]]
 
         # ------------------------
         # 2. Record calendar dates
         # ------------------------
 
         # Record the days when certain trains are active.
-        with z.open("calendar.txt", "r") as csvfile:
-            calendar_reader = csv.reader(TextIOWrapper(csvfile))
-            next(calendar_reader)  # skip the header
-            for r in calendar_reader:
-                self._service_windows[r[0]].append(
-                    ServiceWindow(
-                        id=r[0],
-                        name=r[1],
-                        start=datetime.strptime(r[-2], "%Y%m%d").date(),
-                        end=datetime.strptime(r[-1], "%Y%m%d").date(),
-                        days=set(i for i, j in enumerate(r[2:9]) if int(j) == 1),
-                        removed=False,
-                    )
+        calendar_reader = _csv_reader(z.read("calendar.txt"))
+        columns = _column_indices(
+            calendar_reader,
+            "service_id",
+            "start_date",
+            "end_date",
+            "monday",
+            "tuesday",
+            "wednesday",
+            "thursday",
+            "friday",
+            "saturday",
+            "sunday",
+        )
+        service_id, start_date, end_date = columns[:3]
+        weekdays = columns[3:]
+        for r in calendar_reader:
+            service_windows[r[service_id]].append(
+                ServiceWindow(
+                    id=r[service_id],
+                    name=r[service_id],
+                    start=_resolve_date(r[start_date]),
+                    end=_resolve_date(r[end_date]),
+                    days=set(i for i, j in enumerate(weekdays) if r[j] == "1"),
+                    removed=False,
                 )
+            )
 
         # Find special events/holiday windows where trains are active.
-        with z.open("calendar_dates.txt", "r") as csvfile:
-            calendar_reader = csv.reader(TextIOWrapper(csvfile))
-            next(calendar_reader)  # skip the header
-            for r in calendar_reader:
-                when = datetime.strptime(r[1], "%Y%m%d").date()
-                self._service_windows[r[0]].insert(
-                    0,
-                    ServiceWindow(
-                        id=r[0],
-                        name=r[1],
-                        start=when,
-                        end=when,
-                        days={when.weekday()},
-                        removed=r[-1] == "2",
-                    ),
-                )
+        calendar_reader = _csv_reader(z.read("calendar_dates.txt"))
+        service_id, exception_date, exception_type = _column_indices(
+            calendar_reader, "service_id", "date", "exception_type"
+        )
+        for r in calendar_reader:
+            when = _resolve_date(r[exception_date])
+            service_windows[r[service_id]].insert(
+                0,
+                ServiceWindow(
+                    id=r[service_id],
+                    name=r[exception_date],
+                    start=when,
+                    end=when,
+                    days={when.weekday()},
+                    removed=r[exception_type] == "2",
+                ),
+            )
 
         # ------------------
         # 3. Record stations
         # ------------------
-        with z.open("stops.txt", "r") as csvfile:
-            trip_reader = csv.DictReader(TextIOWrapper(csvfile))
-            for r in trip_reader:
-                # From observation, non-numeric stop IDs are useless information
-                # that should be skipped.
-                if not r["stop_id"].isdigit():
-                    continue
-                stop_name = _STATIONS_RE.match(r["stop_name"]).group(1).strip().upper()
-                self.stations[r["stop_id"]] = {
-                    "name": _RENAME_MAP.get(stop_name, stop_name).title(),
-                    "zone": int(r["zone_id"]) if r["zone_id"] else -1,
-                }
+
+        # Platforms of the same station share a single Station instance, so
+        # station keyed lookups can match on identity.
+        stations_by_id, interned = {}, {}
+
+        stop_reader = _csv_reader(z.read("stops.txt"))
+        stop_id, stop_name, zone_id = _column_indices(
+            stop_reader, "stop_id", "stop_name", "zone_id"
+        )
+        for r in stop_reader:
+            # From observation, non-numeric stop IDs are useless information
+            # that should be skipped.
+            if not r[stop_id].isdigit():
+                continue
+            station = Station(
+                name=_display_name(r[stop_name]),
+                zone=int(r[zone_id]) if r[zone_id] else -1,
+            )
+            stations_by_id[r[stop_id]] = interned.setdefault(station, station)
 
         # ---------------------------
         # 4. Record train definitions
         # ---------------------------
-        with z.open("trips.txt", "r") as csvfile:
-            train_reader = csv.DictReader(TextIOWrapper(csvfile))
-            for r in train_reader:
-                train_dir = int(r["direction_id"])
-                transit_type = TransitType.from_trip_id(r["trip_id"])
-                service_windows = self._service_windows[r["service_id"]]
-                self.trains[r["trip_id"]] = Train(
-                    name=r["trip_short_name"] if r["trip_short_name"] else r["trip_id"],
-                    kind=transit_type,
-                    direction=Direction(train_dir),
-                    stops={},
-                    service_windows=service_windows,
-                )
-
-        self.stations = dict(
-            (k, Station(v["name"], v["zone"])) for k, v in self.stations.items()
+        train_reader = _csv_reader(z.read("trips.txt"))
+        trip_id, service_id, direction_id, trip_short_name = _column_indices(
+            train_reader, "trip_id", "service_id", "direction_id", "trip_short_name"
         )
+        for r in train_reader:
+            train_dir = int(r[direction_id])
+            transit_type = TransitType.from_trip_id(r[trip_id])
+            trains[r[trip_id]] = Train(
+                name=r[trip_short_name] if r[trip_short_name] else r[trip_id],
+                kind=transit_type,
+                direction=Direction(train_dir),
+                stops={},
+                service_windows=service_windows[r[service_id]],
+            )
 
         # -----------------------
         # 5. Record trip stations
         # -----------------------
-        with z.open("stop_times.txt", "r") as csvfile:
-            stop_times_reader = csv.DictReader(TextIOWrapper(csvfile))
-            for r in stop_times_reader:
-                stop_id = r["stop_id"]
-                train = self.trains[r["trip_id"]]
-                arrival_day, arrival = _resolve_time(r["arrival_time"])
-                departure_day, departure = _resolve_time(r["departure_time"])
-                train.stops[self.stations[stop_id]] = Stop(
-                    arrival=arrival,
-                    arrival_day=arrival_day,
-                    departure=departure,
-                    departure_day=departure_day,
-                    stop_number=int(r["stop_sequence"]),
-                )
-
-        # For display
-        self.stations = dict(
-            ("_".join(re.split("[^A-Za-z0-9]", v.name)).lower(), v)
-            for _, v in self.stations.items()
+        stop_times_reader = _csv_reader(z.read("stop_times.txt"))
+        columns = _column_indices(
+            stop_times_reader,
+            "trip_id",
+            "arrival_time",
+            "departure_time",
+            "stop_id",
+            "stop_sequence",
         )
+        trip_id, arrival_time, departure_time, stop_id, stop_sequence = columns
+        # Trains share a small set of distinct time strings, so each one
+        # is only resolved the first time it is seen.
+        times = {}
+        for r in stop_times_reader:
+            train = trains[r[trip_id]]
+            t = r[arrival_time]
+            if t not in times:
+                times[t] = _resolve_time(t)
+            arrival_day, arrival = times[t]
+            t = r[departure_time]
+            if t not in times:
+                times[t] = _resolve_time(t)
+            departure_day, departure = times[t]
+            train.stops[stations_by_id[r[stop_id]]] = Stop(
+                arrival=arrival,
+                arrival_day=arrival_day,
+                departure=departure,
+                departure_day=departure_day,
+                stop_number=int(r[stop_sequence]),
+            )
 
-        # For station lookup by string
-        self._unambiguous_stations = dict(
-            (k.replace("_", ""), v) for k, v in self.stations.items()
-        )
+        # Index every train by each (origin, destination) pair it serves in
+        # its direction of travel, bucketed by each weekday it may run on.
+        # The stops at both ends and the service windows covering each
+        # weekday are kept alongside, so queries need no per-train lookups.
+        # A single entry per pair is shared by all of its weekday buckets.
+        for train in trains.values():
+            windows_by_day = tuple(
+                tuple(sw for sw in train.service_windows if day in sw.days)
+                for day in range(7)
+            )
+            days = [day for day in range(7) if windows_by_day[day]]
+            if not days:
+                continue
+            ordered = sorted(train.stops.items(), key=lambda x: x[1].stop_number)
+            for i, (origin, stop_a) in enumerate(ordered):
+                for destination, stop_b in ordered[i + 1 :]:
+                    key = (origin, destination)
+                    buckets = trains_by_pair_day.get(key)
+                    if buckets is None:
+                        buckets = trains_by_pair_day[key] = tuple([] for _ in range(7))
+                    run = (train, stop_a, stop_b, windows_by_day)
+                    for day in days:
+                        buckets[day].append(run)
+
+        # Key stations by name for display, and by sanitized name for
+        # station lookup by string.
+        stations, unambiguous_stations = {}, {}
+        for v in interned:
+            stations["_".join(_NON_ALNUM_RE.split(v.name)).lower()] = v
+            unambiguous_stations[_sanitize_name(v.name)] = v
+
+        # Resolve aliases up front so a lookup by string needs only one
+        # dict hit.
+        for alias, name in _alias_map().items():
+            if name in unambiguous_stations:
+                unambiguous_stations[alias] = unambiguous_stations[name]
+
+        self.trains = trains
+        self.stations = stations
+        self._unambiguous_stations = unambiguous_stations
+        # Sorted names allow a station to be found by an abbreviation.
+        self._sorted_station_names = sorted(unambiguous_stations)
+        self._service_windows = service_windows
+        self._fares = fares
+        self._trains_by_pair_day = trains_by_pair_day
 
     def get_station(self, name):
         """
         Attempts to resolves a station name from a string into an
-        actual station. An UnknownStationError is thrown if no
-        Station can be derived
+        actual station. Names that are a prefix of only a single
+        station's names are resolved to that station. An
+        UnknownStationError is thrown if no Station can be derived
 
         :param name: the name to resolve
         :type name: str or unicode
@@ -381,12 +722,19 @@ class Caltrain(object):
         :returns: the resolved Station object
         """
         sanitized = _sanitize_name(name)
-        sanitized = _ALIAS_MAP.get(sanitized, sanitized)
-        station = self._unambiguous_stations.get(sanitized, None)
-        if station:
+        station = self._unambiguous_stations.get(sanitized)
+        if station is not None:
             return station
-        else:
+
+        # Sanitized names only contain [a-z0-9], all of which sort
+        # before "{", so the range covers every name with the prefix.
+        names = self._sorted_station_names
+        start = bisect_left(names, sanitized)
+        end = bisect_left(names, sanitized + "{", start)
+        matches = set(self._unambiguous_stations[n] for n in names[start:end])
+        if len(matches) != 1:
             raise UnknownStationError(name)
+        return matches.pop()
 
     def fare_between(self, a, b):
         """
@@ -404,7 +752,7 @@ class Caltrain(object):
         b = self.get_station(b) if not isinstance(b, Station) else b
         return self._fares[(a.zone, b.zone)]
 
-    def next_trips(self, a, b, after=None):
+    def next_trips(self, a, b, after=None, limit=None):
         """
         Returns a list of possible trips to get from stations a to b
         following the after date. These are ordered from soonest to
@@ -417,46 +765,84 @@ class Caltrain(object):
         :param after: the time to find the next trips after
                       (default datetime.now())
         :type after: datetime
+        :param limit: the maximum number of trips to return
+                      (default no limit)
+        :type limit: int
 
         :returns: a list of possible trips
         """
 
+        if limit is not None and limit < 0:
+            raise ValueError("limit must be non-negative: {}".format(limit))
+
         if after is None:
             after = datetime.now()
 
         a = self.get_station(a) if not isinstance(a, Station) else a
         b = self.get_station(b) if not isinstance(b, Station) else b
 
+        # Departures fall on whole seconds, so any fraction of a second
+        # rounds the cutoff up to the next one.
+        cutoff = _seconds(after) + (after.microsecond > 0)
+
+        key = (a, b, after.date())
+        day_trips = self._day_trips_cache.get(key)
+        if day_trips is None:
+            day_trips = self._day_trips(a, b, after.date())
+            if len(self._day_trips_cache) >= _DAY_TRIPS_CACHE_SIZE:
+                # Evict an arbitrary entry. Other threads may be changing
+                # the cache at the same time, so a failed eviction is
+                # skipped rather than raised.
+                try:
+                    stale = next(iter(self._day_trips_cache))
+                except (RuntimeError, StopIteration):
+                    pass
+                else:
+                    self._day_trips_cache.pop(stale, None)
+            self._day_trips_cache[key] = day_trips
+
+        departures, trips = day_trips
+        start = bisect_left(departures, cutoff)
+        if limit is None:
+            return trips[start:]
+        return trips[start : start + limit]
+
+    def _day_trips(self, a, b, day):
+        """
+        Returns every trip from stations a to b running on the given
+        day, ordered by departure. Results are cached per station pair
+        and day by next_trips.
+
+        :param a: the starting station
+        :type a: Station
+        :param b: the destination station
+        :type b: Station
+        :param day: the day to find trips on
+        :type day: date
+
+        :returns: tuple of the ordered departure times (in seconds since
+                  midnight) and the trips
+        """
+
         possibilities = []
+        weekday = day.weekday()
 
-        for name, train in self.trains.items():
+        for train, stop_a, stop_b, windows_by_day in self._trains_by_pair_day.get(
+            (a, b), _NO_TRAINS
+        )[weekday]:
 
             should_skip = set()
 
-            for sw in train.service_windows:
-                in_time_window = (
-                    sw.start <= after.date() <= sw.end and after.weekday() in sw.days
-                )
-                stops_at_stations = a in train.stops and b in train.stops
+            for sw in windows_by_day[weekday]:
+                in_time_window = sw.start <= day <= sw.end
 
-                if not in_time_window or not stops_at_stations or sw.id in should_skip:
+                if not in_time_window or sw.id in should_skip:
                     continue
 
                 if sw.removed:
                     should_skip.add(sw.id)
                     continue
 
-                stop_a = train.stops[a]
-                stop_b = train.stops[b]
-
-                # Check to make sure this train is headed in the right direction.
-                if stop_a.stop_number > stop_b.stop_number:
-                    continue
-
-                # Check to make sure this train has not left yet.
-                if stop_a.departure < after.time():
-                    continue
-
                 possibilities.append(
                     Trip(
                         departure=stop_a.departure,
@@ -466,5 +852,5 @@ class Caltrain(object):
                     )
                 )
 
-        possibilities.sort(key=lambda x: x.departure)
-        return possibilities
+        possibilities.sort(key=attrgetter("departure"))
+        return [_seconds(t.departure) for t in possibilities], possibilities